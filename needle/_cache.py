@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """A dict-like cache that holds at most `maxsize` entries.
+
+    The least recently used entry is evicted to make room for a new one.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value  # mark as most recently used
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self._data.clear()
+
+
+def memoize(maxsize=128):
+    "Decorator caching a function of hashable arguments in an LRUCache."
+    def decorator(func):
+        cache = LRUCache(maxsize)
+        def wrapper(*args):
+            try:
+                return cache[args]
+            except KeyError:
+                result = func(*args)
+                cache[args] = result
+                return result
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def levenberg_marquardt(model, jacobian, x, y, p0, weights=None,
+                        max_iterations=100, tolerance=1.5e-8):
+    """Solve many independent nonlinear least-squares problems at once.
+
+    Each of the M problems fits model(x, p) to a row of y. The Levenberg-
+    Marquardt iterations run on all problems together as array operations,
+    and problems that have converged drop out of the active set.
+
+    Parameters
+    ----------
+    model : function(x, p) -> array with shape (M, W)
+        p has shape (M, P)
+    jacobian : function(x, p) -> array with shape (M, W, P)
+    x : array with shape (W,) shared by all problems, or (M, W)
+    y : array with shape (M, W)
+    p0 : initial guesses, shape (M, P)
+    weights : optional array with shape (M, W)
+        Points with zero weight are ignored; use this to mask out padding.
+    max_iterations : int, default 100
+    tolerance : float, default 1.5e-8
+        A problem is considered converged when an accepted step reduces
+        the sum of squares, or changes the parameters, by less than this
+        relative amount. (The default matches scipy.optimize.leastsq.)
+
+    Returns
+    -------
+    popt, pcov, success
+        best fits (M, P), their covariances (M, P, P), scaled by the
+        residual variance like scipy.optimize.curve_fit, and a boolean array
+        (M,) marking problems that converged. Rows of popt and pcov for
+        problems that did not converge are NaN.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    p = np.array(p0, dtype=float)
+    M, P = p.shape
+    if weights is None:
+        weights = np.ones_like(y)
+    weights = np.asarray(weights, dtype=float)
+    shared_x = x.ndim == 1
+
+    def subset(index):
+        return x if shared_x else x[index]
+
+    def cost(x, y, w, p):
+        return (w * (y - model(x, p))**2).sum(axis=1)
+
+    damping = np.full(M, 1e-3)
+    chi2 = cost(x, y, weights, p)
+    converged = np.zeros(M, dtype=bool)
+    active = np.flatnonzero(np.isfinite(chi2))
+    identity = np.eye(P)
+    for iteration in range(max_iterations):
+        if not len(active):
+            break
+        xa, ya, wa, pa = subset(active), y[active], weights[active], p[active]
+        J = jacobian(xa, pa)
+        r = ya - model(xa, pa)
+        JTw = np.swapaxes(J, 1, 2) * wa[:, np.newaxis, :]
+        JTJ = np.matmul(JTw, J)
+        gradient = np.matmul(JTw, r[..., np.newaxis])
+        diagonal = JTJ.diagonal(axis1=1, axis2=2)
+        scale = damping[active, np.newaxis] * (diagonal + 1e-12)
+        A = JTJ + scale[:, :, np.newaxis] * identity
+        try:
+            step = np.linalg.solve(A, gradient)[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.matmul(np.linalg.pinv(A), gradient)[..., 0]
+        trial = pa + step
+        with np.errstate(over='ignore', invalid='ignore'):
+            trial_chi2 = cost(xa, ya, wa, trial)
+        better = trial_chi2 < chi2[active]
+        accepted = active[better]
+        reduction = (chi2[accepted] - trial_chi2[better]) / chi2[accepted]
+        small_step = (np.abs(step[better]) <=
+                      tolerance * np.abs(pa[better])).all(axis=1)
+        p[accepted] = trial[better]
+        chi2[accepted] = trial_chi2[better]
+        damping[accepted] /= 10
+        damping[active[~better]] *= 10
+        # A problem is converged when an accepted step barely changed
+        # anything, or when no step, however small, reduces the sum of
+        # squares.
+        done = np.zeros(len(active), dtype=bool)
+        done[better] = ~(reduction > tolerance) | small_step
+        done[~better] = damping[active[~better]] > 1e10
+        done |= chi2[active] == 0
+        converged[active[done]] = True
+        active = active[~done]
+
+    p[~converged] = np.nan
+    pcov = covariance(jacobian, x, p, chi2, weights)
+    success = converged & np.isfinite(p).all(axis=1)
+    return p, pcov, success
+
+
+def covariance(jacobian, x, p, chi2, weights):
+    """Estimate the covariance of best-fit parameters for many problems.
+
+    Like scipy.optimize.curve_fit, the inverse of J^T J is scaled by the
+    residual variance, chi2 / (number of points - number of parameters).
+    The arguments follow levenberg_marquardt; chi2 is the weighted sum of
+    squared residuals of each problem, shape (M,). Problems with
+    non-finite parameters get NaN covariances.
+    """
+    finite = np.isfinite(p).all(axis=1) & np.isfinite(chi2)
+    if x.ndim > 1:
+        x = x[finite]
+    weights = weights[finite]
+    J = jacobian(x, p[finite])
+    JTJ = np.matmul(np.swapaxes(J, 1, 2) * weights[:, np.newaxis, :], J)
+    dof = (weights > 0).sum(axis=1) - p.shape[1]
+    pcov = np.full(p.shape + p.shape[-1:], np.nan)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        variance = chi2[finite] / dof
+        pcov[finite] = (np.linalg.pinv(JTJ) *
+                        variance[:, np.newaxis, np.newaxis])
+    return pcov
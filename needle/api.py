@@ -1,6 +1,8 @@
 import preprocessing
 import covariance
+import centroids
 import plotting
 
 from .preprocessing import prepare
+from .pipeline import Pipeline
 from .plotting import annotate
@@ -1,29 +1,571 @@
+import numpy as np
 import pandas as pd
+from scipy import ndimage
+from ._least_squares import levenberg_marquardt
+
+
+def _cumulative(values):
+    "Cumulative sum along the first axis, starting from a row of zeros."
+    zeros = np.zeros((1,) + values.shape[1:], dtype=values.dtype)
+    return np.concatenate([zeros, np.cumsum(values, axis=0)])
+
+
+def _trailing_count(flags, window):
+    """Count the True flags in each trailing window, or return None if there
+    are none at all."""
+    if not flags.any():
+        return None
+    cumulative = _cumulative(flags.astype(np.intp))
+    return cumulative[window:] - cumulative[:-window]
+
+
+def _rolling_sum(values, window):
+    """Sum over trailing windows, like pd.rolling_sum with min_periods=window.
+
+    Arrays with more than one dimension are summed along the first axis.
+    The sums are differences of a cumulative sum, so the cost does not
+    depend on the window. A window holding any NaN gives NaN, as does one
+    running off the start of the array.
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    if window > len(values):
+        return result
+    missing = ~np.isfinite(values)
+    count = _trailing_count(missing, window)
+    if count is not None:
+        values = np.where(missing, 0, values)
+    cumulative = _cumulative(values)
+    sums = result[window - 1:]
+    np.subtract(cumulative[window:], cumulative[:-window], out=sums)
+    if count is not None:
+        sums[count > 0] = np.nan
+    return result
+
+
+def _rolling_mean_std(values, window):
+    """Mean and standard deviation (ddof=1) over trailing windows.
+
+    This is like pd.rolling_mean and pd.rolling_std, from cumulative sums.
+    The data are first centered on their mean, which keeps the sums of
+    squares small and the variances accurate. Arrays with more than one
+    dimension are treated along the first axis.
+    """
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values)
+    offset = (np.where(finite, values, 0).sum(axis=0) /
+              np.maximum(finite.sum(axis=0), 1))
+    centered = values - offset
+    mean = _rolling_sum(centered, window)
+    mean /= window
+    centered **= 2
+    variance = _rolling_sum(centered, window)
+    variance -= window*mean**2
+    variance /= window - 1
+    np.maximum(variance, 0, out=variance)  # NaN stays NaN
+    mean += offset
+    return mean, np.sqrt(variance, out=variance)
+
+
+def _rolling_max_centered(values, window):
+    """Maximum over centered windows, like pd.rolling_max(center=True).
+
+    The window of point i spans i - window//2 to i + (window - 1)//2. Any
+    window holding a NaN or running off either end of the array gives NaN.
+    Arrays with more than one dimension are treated along the first axis.
+    The maxima come from ndimage.maximum_filter1d, which uses Harter's
+    monotonic wedge (MINLIST) algorithm, in O(n) time overall.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if window > n:
+        return np.full(values.shape, np.nan)
+    missing = ~np.isfinite(values)
+    count = _trailing_count(missing, window)
+    if count is not None:
+        values = np.where(missing, -np.inf, values)
+    result = ndimage.maximum_filter1d(values, window, axis=0, mode='nearest')
+    before = window//2
+    after = window - 1 - before
+    result[:before] = np.nan
+    result[n - after:] = np.nan
+    if count is not None:
+        # the window of point i is the trailing window ending at i + after
+        result[before:n - after][count > 0] = np.nan
+    return result
+
+
+def jump_statistic(values, z_window=10, f_window=7):
+    """Compute the statistic that locate_jumps tests for jumps.
+
+    Each point gets a z-score in the context of the z_window points ending
+    with it. Then f at point i is the sum of the squared z-scores of the
+    f_window points after i minus that of the f_window points ending with
+    i. Points without a full context of finite values get NaN.
+
+    Parameters
+    ----------
+    values : 1D array of angle data, or 2D array with a series in each
+        column
+    z_window : size of noise sample. Default 10.
+    f_window : compare these points ahead and behind. Default 7.
+
+    Returns
+    -------
+    f : array like values
+    """
+    values = np.asarray(values, dtype=float)
+    mean, std = _rolling_mean_std(values, z_window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - mean)/std
+    squares = _rolling_sum(z**2, f_window)  # NaN for non-finite z, too
+    f = np.full(values.shape, np.nan)
+    f[:-f_window] = squares[f_window:] - squares[:-f_window]
+    return f
+
+
+_BLOCK_SIZE = 2**16  # samples processed together by locate_jumps
+
+
+def _jumps(values, z_window, f_window, maxima_window, significance):
+    "Return the statistic f and the mask of jumps, as in locate_jumps."
+    f = jump_statistic(values, z_window, f_window)
+    with np.errstate(invalid='ignore'):
+        jumps = ((f == _rolling_max_centered(f, maxima_window)) &
+                 (f > 2*f_window*significance))
+    return f, jumps
+
+
+def _noise_sigma(values):
+    """Estimate the standard deviation of the noise on a piecewise-constant
+    signal, robustly, from the median absolute difference of neighbors."""
+    differences = np.abs(np.diff(values))
+    if not len(differences):
+        return 0.
+    return 1.4826*np.median(differences)/np.sqrt(2)
+
+
+class _SegmentCost(object):
+    """The cost of a segment, its sum of squared deviations from its mean,
+    in constant time from cumulative sums."""
+    def __init__(self, values):
+        values = values - values.mean()  # keeps the sums of squares small
+        self.sums = _cumulative(values)
+        self.squares = _cumulative(values**2)
+
+    def __call__(self, start, stop):
+        n = stop - start
+        total = self.sums[stop] - self.sums[start]
+        return self.squares[stop] - self.squares[start] - total**2/n
+
+    def mean(self, start, stop):
+        return (self.sums[stop] - self.sums[start])/(stop - start)
+
+
+def _pelt(cost, n, penalty, min_size, max_candidates=None):
+    """Return the starts of segments with the least total cost plus penalty
+    per change, by dynamic programming with PELT pruning (Killick et al.,
+    2012).
+
+    Pruning only works when there are change points to prune at; without
+    them every start survives and the loop is quadratic. If max_candidates
+    is given, only that many of the most promising starts are kept, which
+    bounds the work at O(n*max_candidates) but is no longer exact.
+    """
+    total = np.empty(n + 1)
+    total[0] = -penalty
+    last = np.zeros(n + 1, dtype=int)
+    candidates = np.array([0])
+    for t in range(min_size, n + 1):
+        costs = total[candidates] + cost(candidates, t)
+        best = costs.argmin()
+        total[t] = costs[best] + penalty
+        last[t] = candidates[best]
+        # Drop starts that can never be optimal again.
+        keep = costs <= total[t]
+        if max_candidates is not None and keep.sum() >= max_candidates:
+            keep = np.zeros(len(costs), dtype=bool)
+            keep[np.argpartition(costs, max_candidates - 2)[
+                :max_candidates - 1]] = True
+        candidates = np.append(candidates[keep], t - min_size + 1)
+    starts = []
+    t = last[n]
+    while t > 0:
+        starts.append(t)
+        t = last[t]
+    return np.array(starts[::-1], dtype=int)
+
+
+def _binseg(cost, n, penalty, min_size):
+    """Return the starts of segments found by binary segmentation: split
+    each segment where that most reduces the cost, while the reduction
+    exceeds the penalty."""
+    starts = []
+    segments = [(0, n)]
+    while segments:
+        start, stop = segments.pop()
+        splits = np.arange(start + min_size, stop - min_size + 1)
+        if not len(splits):
+            continue
+        gain = cost(start, stop) - cost(start, splits) - cost(splits, stop)
+        best = gain.argmax()
+        if gain[best] > penalty:
+            split = splits[best]
+            starts.append(split)
+            segments.extend([(start, split), (split, stop)])
+    return np.sort(np.array(starts, dtype=int))
+
+
+def _change_points(values, method, penalty=None, min_size=2,
+                   max_candidates=None):
+    """Find the jumps in a piecewise-constant series by penalized least
+    squares.
+
+    NaNs are skipped. Returns the position of the last sample before each
+    jump, and the size of each jump in units of the noise sigma.
+    """
+    finite = np.flatnonzero(np.isfinite(values))
+    values = values[finite]
+    n = len(values)
+    sigma = _noise_sigma(values)
+    if n < 2*min_size or sigma == 0:
+        return np.empty(0, dtype=int), np.empty(0)
+    if penalty is None:
+        penalty = 3*np.log(n)  # modified BIC, as in Zhang & Siegmund (2007)
+    cost = _SegmentCost(values)
+    if method == 'pelt':
+        starts = _pelt(cost, n, penalty*sigma**2, min_size, max_candidates)
+    else:
+        starts = _binseg(cost, n, penalty*sigma**2, min_size)
+    bounds = np.concatenate([[0], starts, [n]])
+    levels = cost.mean(bounds[:-1], bounds[1:])
+    return finite[starts - 1], np.abs(np.diff(levels))/sigma
 
 
 def locate_jumps(data, z_window=10, f_window=7,
-               maxima_window=100, significance=2):
+               maxima_window=100, significance=2, method='window',
+               penalty=None, max_candidates=1000):
     """Find the points when the B-field was stepped.
 
     Parameters
     ----------
-    data : Series of angle data, indexed by frame or time
+    data : Series of angle data, indexed by frame or time, or a 1D array;
+        or a DataFrame or 2D array with one series in each column, all
+        processed at once
     z_window : Size of noise sample
         Default 10.
     f_window : Compare these points ahead and behind to detect a jump.
         Default 7.
     maxima_window : Minimum spacing of distinct jumps. Default 100.
     significance: Minimum significance of a jump; in units of sigma. Default 2.
+    method : {'window', 'binseg', 'pelt'}
+        'window' (default) tests each point against the windows around it,
+        using the parameters above.
+        'binseg' and 'pelt' instead fit the data with constant segments,
+        minimizing the squared residuals plus a penalty for each jump. They
+        need no windows and resolve closely spaced jumps. 'binseg' (binary
+        segmentation) splits segments one at a time, in vectorized passes,
+        taking O(n log n) time; use it for long traces. 'pelt' finds the
+        optimum by dynamic programming with pruning, in a Python-level loop.
+        Pruning needs jumps: with few of them the work grows quadratically
+        with n, and it is bounded only by max_candidates.
+    penalty : float, optional
+        For 'binseg' and 'pelt', the penalty per jump, in units of the noise
+        variance, which is estimated from the median absolute difference of
+        consecutive points. Default 3*log(n), as in the modified Bayesian
+        information criterion, which seldom finds jumps in pure noise.
+        Larger values find fewer jumps.
+    max_candidates : int or None, optional
+        For 'pelt', the most segment starts kept at each step, the ones with
+        the least cost so far. Default 1000. This bounds the work at
+        O(n*max_candidates); the result can differ from the exact optimum
+        only where more starts than this survive pruning, that is in long
+        stretches without jumps. None gives the exact, possibly quadratic,
+        search.
+
+    Returns
+    -------
+    For one series, an array of positions where jumps occurred: index
+    values of a Series, or integer positions in an array. For 'binseg'
+    and 'pelt', the position is the last point before the jump; the
+    'window' method marks a point up to f_window points before it.
+    For many series, a DataFrame with a row for each jump, ordered by
+    series and position, and the columns 'series' (column label or
+    number), 'position' (index value or row number) and 'significance'
+    (for 'window', f/(2*f_window), which exceeds the significance
+    parameter; otherwise the size of the jump in units of the noise sigma).
+    """
+    values = np.asarray(data, dtype=float)
+    if values.ndim > 2:
+        raise ValueError("data must be one- or two-dimensional")
+    if method not in ('window', 'binseg', 'pelt'):
+        raise ValueError("method must be 'window', 'binseg' or 'pelt'")
+    if method != 'window':
+        strength = np.full(values.shape, np.nan)
+        jumps = np.zeros(values.shape, dtype=bool)
+        shape = (len(values), values.shape[1] if values.ndim == 2 else 1)
+        for column, jumps_of, strength_of in zip(
+                values.reshape(shape).T, jumps.reshape(shape).T,
+                strength.reshape(shape).T):
+            positions, strength_of[positions] = _change_points(
+                column, method, penalty, max_candidates=max_candidates)
+            jumps_of[positions] = True
+    elif values.ndim == 1:
+        f, jumps = _jumps(values, z_window, f_window, maxima_window,
+                          significance)
+        strength = f/(2*f_window)
+    else:
+        # Take a block of columns at a time, small enough to stay in cache.
+        f = np.empty(values.shape)
+        jumps = np.empty(values.shape, dtype=bool)
+        step = max(1, _BLOCK_SIZE//max(len(values), 1))
+        for start in range(0, values.shape[1], step):
+            block = slice(start, start + step)
+            f[:, block], jumps[:, block] = _jumps(
+                values[:, block], z_window, f_window, maxima_window,
+                significance)
+        strength = f/(2*f_window)
+    if values.ndim == 1:
+        if isinstance(data, pd.Series):
+            return data.index.values[jumps]
+        return np.flatnonzero(jumps)
+    # Transpose to order the jumps by series, then by position.
+    series, position = np.nonzero(jumps.T)
+    if isinstance(data, pd.DataFrame):
+        labels, index = data.columns.values, data.index.values
+    else:
+        labels, index = np.arange(values.shape[1]), np.arange(len(values))
+    return pd.DataFrame({'series': labels[series],
+                         'position': index[position],
+                         'significance': strength[position, series]},
+                        columns=['series', 'position', 'significance'])
+
+
+def _exponential(t, p):
+    "Evaluate offset + amplitude*exp(-t/tau) for each row of parameters p."
+    offset, amplitude, tau = [p[:, i:i+1] for i in range(3)]
+    return offset + amplitude*np.exp(-t/tau)
+
+
+def _exponential_jacobian(t, p):
+    "Analytic Jacobian of _exponential with respect to (offset, amplitude, tau)"
+    offset, amplitude, tau = [p[:, i:i+1] for i in range(3)]
+    e = np.exp(-t/tau)
+    return np.stack([np.ones_like(t*e), e, amplitude*e*t/tau**2], axis=-1)
+
+
+def _exponential_guess(t, y, mask):
+    """Guess (offset, amplitude, tau) from the tail level, the first point,
+    and the area between the curve and the tail level."""
+    n = mask.sum(axis=1)
+    tail = mask & (np.arange(mask.shape[1]) >= (3*n[:, np.newaxis])//4)
+    offset = (y*tail).sum(axis=1)/tail.sum(axis=1)
+    amplitude = y[:, 0] - offset
+    duration = t[np.arange(len(t)), n - 1]
+    dt = duration/np.maximum(n - 1, 1)
+    area = (np.abs(y - offset[:, np.newaxis])*mask).sum(axis=1)*dt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = area/np.abs(amplitude)
+    tau = np.clip(np.nan_to_num(tau), dt, duration)
+    return np.column_stack([offset, amplitude, tau])
+
+
+def _linear(t, p):
+    "Evaluate offset + slope*t for each row of parameters p."
+    return p[:, :1] + p[:, 1:2]*t
+
+
+def _linear_jacobian(t, p):
+    "Jacobian of _linear with respect to (offset, slope)"
+    return np.stack([np.ones_like(t), t], axis=-1)
+
+
+def _linear_guess(t, y, mask):
+    "Guess (offset, slope) from the first and last points."
+    n = mask.sum(axis=1)
+    rows = np.arange(len(t))
+    last_t, last_y = t[rows, n - 1], y[rows, n - 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.nan_to_num((last_y - y[:, 0])/last_t)
+    return np.column_stack([y[:, 0], slope])
+
+
+# name: (model, jacobian, initial guess, parameter names)
+_SEGMENT_MODELS = {
+    'exponential': (_exponential, _exponential_jacobian, _exponential_guess,
+                    ['offset', 'amplitude', 'tau']),
+    'linear': (_linear, _linear_jacobian, _linear_guess,
+               ['offset', 'slope'])}
+
+
+def fit_segments(data, jumps, model='exponential', min_length=5,
+                 batch_size=1024):
+    """Fit a model to the relaxation after each jump, all segments at once.
+
+    Each segment runs from the point after a jump up to the next jump, or
+    to the end of the data. The segments are padded to a common length,
+    with the padding masked out, and fit together by a batched
+    Levenberg-Marquardt solver.
+
+    Parameters
+    ----------
+    data : Series of angle data, indexed by frame or time, or a 1D array
+    jumps : positions of the jumps, as returned by locate_jumps: the last
+        point before each jump
+    model : {'exponential', 'linear'}
+        'exponential' fits offset + amplitude*exp(-t/tau), and 'linear'
+        fits offset + slope*t, where t is the time since the start of the
+        segment, in units of the index.
+    min_length : minimum number of (non-NaN) points in a segment to fit it.
+        Default 5.
+    batch_size : number of segments solved together. Segments are grouped
+        by length, so that each batch is padded only to its own longest
+        segment. Default 1024.
 
     Returns
     -------
-    array of positions where jumps occurred
-    """
-    # Each point's z-score in the context of the preceding ones.
-    z = (data - pd.rolling_mean(data, z_window))/pd.rolling_std(data, z_window)
-    # f = z_{before}^2 - z_{after}^2
-    f = pd.rolling_sum(z.shift(-f_window)**2 - z**2, f_window)
-    jumps = ((f == pd.rolling_max(f, maxima_window, center=True)) & \
-             (f > 2*f_window*significance))
-    print jumps.value_counts()
-    return jumps[jumps].index.values
+    DataFrame with a row for each segment: its 'start' and 'stop' (the
+    index values of its first and last points), 'length' (number of
+    non-NaN points), the best-fit parameters, their standard errors (as
+    columns named like 'tau_err'), and 'success'. Segments that were too
+    short or did not converge have NaN parameters.
+    """
+    if model not in _SEGMENT_MODELS:
+        raise ValueError("model must be one of {0}".format(
+            sorted(_SEGMENT_MODELS)))
+    func, jacobian, guess, names = _SEGMENT_MODELS[model]
+    values = np.asarray(data, dtype=float)
+    if isinstance(data, pd.Series):
+        index = data.index.values
+        positions = data.index.get_indexer(np.asarray(jumps))
+        if (positions < 0).any():
+            raise ValueError("jumps must be values of the index of data")
+    else:
+        index = np.arange(len(values))
+        positions = np.asarray(jumps, dtype=int)
+    starts = np.sort(positions) + 1
+    starts = starts[starts < len(values)]
+    stops = np.append(starts[1:], len(values))[:len(starts)]
+    finite = np.isfinite(values)
+    counts = np.concatenate([[0], np.cumsum(finite)])
+    lengths = counts[stops] - counts[starts]
+
+    P = len(names)
+    params = np.full((len(starts), P), np.nan)
+    errors = np.full((len(starts), P), np.nan)
+    success = np.zeros(len(starts), dtype=bool)
+    fitted = np.flatnonzero(lengths >= max(min_length, P + 1))
+    fitted = fitted[np.argsort(stops[fitted] - starts[fitted],
+                               kind='mergesort')]
+    time = np.asarray(index, dtype=float)
+    for batch in (fitted[i:i + batch_size]
+                  for i in range(0, len(fitted), batch_size)):
+        width = (stops[batch] - starts[batch]).max()
+        columns = np.arange(width)
+        points = starts[batch, np.newaxis] + columns
+        mask = points < stops[batch, np.newaxis]
+        points = np.where(mask, points, starts[batch, np.newaxis])
+        mask &= finite[points]
+        # Move each segment's non-NaN points to the front.
+        order = np.argsort(~mask, axis=1, kind='mergesort')
+        points = np.take_along_axis(points, order, axis=1)
+        mask = np.take_along_axis(mask, order, axis=1)
+        y = np.where(mask, values[points], 0.)
+        t = np.where(mask, time[points] - time[points[:, :1]], 0.)
+        popt, pcov, ok = levenberg_marquardt(
+            func, jacobian, t, y, guess(t, y, mask), weights=mask)
+        params[batch] = popt
+        errors[batch] = np.sqrt(np.diagonal(pcov, axis1=1, axis2=2))
+        success[batch] = ok
+
+    result = pd.DataFrame({'start': index[starts],
+                           'stop': index[stops - 1],
+                           'length': lengths},
+                          columns=['start', 'stop', 'length'])
+    for i, name in enumerate(names):
+        result[name] = params[:, i]
+    for i, name in enumerate(names):
+        result[name + '_err'] = errors[:, i]
+    result['success'] = success
+    return result
+
+
+class JumpDetector(object):
+    """Find the points when the B-field was stepped, while data come in.
+
+    Feed angle samples one at a time or in chunks. Each jump is reported
+    once the data after it settle the test of locate_jumps, which is
+    f_window + (maxima_window - 1)//2 samples later, and the jumps found are
+    the same as those of locate_jumps on all the data.
+
+    Only the samples that later tests still need are kept, fewer than
+    z_window + 2*f_window + maxima_window of them.
+
+    Parameters
+    ----------
+    z_window, f_window, maxima_window, significance : see locate_jumps
+
+    Attributes
+    ----------
+    count : number of samples fed so far
+    latency : number of samples after a jump before it is reported
+
+    Example
+    -------
+    >>> detector = JumpDetector()
+    >>> for angle in stream:
+    ...     for position in detector.update(angle):
+    ...         step_field()
+    """
+    def __init__(self, z_window=10, f_window=7, maxima_window=100,
+                 significance=2):
+        self.z_window = z_window
+        self.f_window = f_window
+        self.maxima_window = maxima_window
+        self.significance = significance
+        self.latency = f_window + (maxima_window - 1)//2
+        self.reset()
+
+    def reset(self):
+        "Forget all the data."
+        self.count = 0
+        self._buffer = np.empty(0)
+        self._start = 0  # position of the first sample in the buffer
+        self._next = 0  # first position not yet tested
+
+    def update(self, values):
+        """Feed in new samples.
+
+        Parameters
+        ----------
+        values : a number or a 1D array of angle data
+
+        Returns
+        -------
+        array of the positions of newly found jumps, counting samples from
+        the first one fed in
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        self._buffer = np.concatenate([self._buffer, values])
+        self.count += len(values)
+        last = self.count - 1 - self.latency  # the last position testable
+        jumps = np.empty(0, dtype=int)
+        if last >= self._next:
+            f = jump_statistic(self._buffer, self.z_window, self.f_window)
+            maxima = _rolling_max_centered(f, self.maxima_window)
+            tested = slice(self._next - self._start, last + 1 - self._start)
+            f, maxima = f[tested], maxima[tested]
+            with np.errstate(invalid='ignore'):
+                found = ((f == maxima) &
+                         (f > 2*self.f_window*self.significance))
+            jumps = self._next + np.flatnonzero(found)
+            self._next = last + 1
+        # Keep the samples needed to test the next position: the maxima
+        # window around it, the f windows around those, and the z windows
+        # before them.
+        keep = (self._next - self.maxima_window//2 - self.f_window -
+                self.z_window + 2)
+        if keep > self._start:
+            self._buffer = self._buffer[keep - self._start:]
+            self._start = keep
+        return jumps
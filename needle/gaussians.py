@@ -1,8 +1,10 @@
 import numpy as np
 from scipy.optimize import curve_fit
-from scipy.stats import linregress
 from pandas import Series
+from scipy import ndimage
 from skimage import transform
+from ._cache import memoize
+from ._least_squares import levenberg_marquardt, covariance
 
 
 def _gaussian(x, A, sigma, x0):
@@ -18,36 +20,432 @@ def fit_row(x, row, guess):
     return popt, pcov
 
 
-def fit_rows(image, guess_sigma=5.):
-    "Fit a Gaussian to each row of pixels. Return best fits, fit covariances."
-    x = np.arange(image.shape[1])
-    guess = [image.max(), guess_sigma, image.shape[1] / 2.]
-    fits = np.empty((image.shape[0], 3))
-    for i, row in enumerate(image):
-        fit, cov = fit_row(x, row, guess)
-        guess = fit
-        fits[i] = fit
-    return fits
+def _gaussian_rows(x, p):
+    "Evaluate a Gaussian for each row of parameters p (A, sigma, x0)."
+    A, sigma, x0 = [p[:, i:i+1] for i in range(3)]
+    return A*np.exp(-(x - x0)**2/(2*sigma))
+
+
+def _gaussian_rows_jacobian(x, p):
+    "Analytic Jacobian of _gaussian_rows with respect to (A, sigma, x0)."
+    A, sigma, x0 = [p[:, i:i+1] for i in range(3)]
+    dx = x - x0
+    e = np.exp(-dx**2/(2*sigma))
+    return np.stack([e, A*e*dx**2/(2*sigma**2), A*e*dx/sigma], axis=-1)
+
+
+def log_parabola(x, rows, min_fraction=0.2):
+    """Estimate Gaussian parameters for many rows in closed form.
+
+    This is Caruana's algorithm: a quadratic fit to the log of the
+    intensities, weighted by the squared intensities (after Guo) to
+    suppress noise in the dim tails. Pixels dimmer than min_fraction of the
+    row's peak are ignored.
+
+    Parameters
+    ----------
+    x : pixel positions, shape (W,)
+    rows : array with shape (M, W)
+    min_fraction : float, default 0.2
+
+    Returns
+    -------
+    estimates : array with shape (M, 3) of (A, sigma, x0), NaN where the
+    intensities do not curve downward
+    """
+    rows = np.asarray(rows, dtype=float)
+    peak = rows.max(axis=1)[:, np.newaxis]
+    used = rows > min_fraction*peak
+    weights = np.where(used, rows**2, 0)
+    log_rows = np.log(np.where(used, rows, 1))
+    center = x.mean()  # centering keeps the normal equations well-conditioned
+    powers = (x - center)**np.arange(5)[:, np.newaxis]  # shape (5, W)
+    S = weights.dot(powers.T)  # S[:, k] = sum(w x**k)
+    T = (weights*log_rows).dot(powers[:3].T)  # T[:, k] = sum(w x**k log y)
+    normal = S[:, np.array([[0, 1, 2], [1, 2, 3], [2, 3, 4]])]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        singular = ~(np.abs(np.linalg.det(normal)) > 0)
+        normal[singular] = np.eye(3)
+        c0, c1, c2 = np.linalg.solve(normal, T[..., np.newaxis])[..., 0].T
+        sigma = -1/(2*c2)
+        x0 = center - c1/(2*c2)
+        A = np.exp(c0 - c1**2/(4*c2))
+    estimates = np.column_stack([A, sigma, x0])
+    estimates[singular | ~(c2 < 0)] = np.nan
+    return estimates
+
+
+def fit_rows(image, guess_sigma=5., method='lm', tolerance=0.05,
+             guess=None):
+    """Fit a Gaussian to each row of pixels. Return best fits, fit covariances.
+
+    Parameters
+    ----------
+    image : image array, or a stack of images with shape (N, rows, columns)
+    guess_sigma : initial guess for Gaussian width
+    method : {'lm', 'logparabola', 'curve_fit'}
+        'lm' (default) fits all rows, of all images, at once with a
+        vectorized Levenberg-Marquardt solver, starting each row from its
+        brightest pixel. 'logparabola' estimates each row in closed form
+        (see log_parabola) and refines with 'lm' only the rows whose
+        residuals exceed the tolerance. 'curve_fit' fits one row at a time
+        with scipy.optimize.curve_fit, seeding each fit with the previous
+        row's. It only accepts a single image.
+    tolerance : float, default 0.05
+        For 'logparabola', the largest acceptable RMS residual of a row,
+        as a fraction of its fitted amplitude
+    guess : optional array with shape (..., rows, 3)
+        Initial (A, sigma, x0) for each row, e.g., the fits from a previous
+        frame. Rows containing NaN start from the default guess. Not used
+        by 'curve_fit'.
+
+    Returns
+    -------
+    fits : array with shape (..., rows, 3) of (A, sigma, x0) for each row
+    covs : array with shape (..., rows, 3, 3) of fit covariances
+    Rows that could not be fit are NaN.
+    """
+    image = np.asarray(image)
+    x = np.arange(image.shape[-1])
+    if method == 'curve_fit':
+        if image.ndim != 2:
+            raise ValueError("The 'curve_fit' method accepts only one image.")
+        guess = [image.max(), guess_sigma, image.shape[1] / 2.]
+        fits = np.empty((image.shape[0], 3))
+        covs = np.empty((image.shape[0], 3, 3))
+        for i, row in enumerate(image):
+            fit, cov = fit_row(x, row, guess)
+            guess = fit
+            fits[i] = fit
+            covs[i] = cov
+        return fits, covs
+    elif method not in ('lm', 'logparabola'):
+        raise ValueError("Unknown method {0}".format(method))
+    rows = image.reshape(-1, image.shape[-1]).astype(float)
+    default_guess = np.column_stack([rows.max(axis=1),
+                                     np.full(len(rows), float(guess_sigma)),
+                                     rows.argmax(axis=1).astype(float)])
+    if guess is None:
+        guess = default_guess
+    else:
+        guess = np.array(guess, dtype=float).reshape(-1, 3)
+        missing = ~np.isfinite(guess).all(axis=1)
+        guess[missing] = default_guess[missing]
+    guess[~(default_guess[:, 0] > 0)] = np.nan  # nothing to fit in a dark row
+    if method == 'lm':
+        fits, covs, success = levenberg_marquardt(
+            _gaussian_rows, _gaussian_rows_jacobian, x, rows, guess)
+    else:
+        fits = log_parabola(x, rows)
+        chi2 = ((rows - _gaussian_rows(x, fits))**2).sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            rms = np.sqrt(chi2 / rows.shape[1]) / fits[:, 0]
+            refit = ~(rms <= tolerance)
+        covs = covariance(_gaussian_rows_jacobian, x, fits, chi2,
+                          np.ones_like(rows))
+        estimated = np.isfinite(fits).all(axis=1)
+        seeds = np.where(estimated[:, np.newaxis], fits, guess)[refit]
+        fits[refit], covs[refit], success = levenberg_marquardt(
+            _gaussian_rows, _gaussian_rows_jacobian, x, rows[refit], seeds)
+    return (fits.reshape(image.shape[:-1] + (3,)),
+            covs.reshape(image.shape[:-1] + (3, 3)))
+
+
+def fit_rows_adaptive(image, step=4, guess_sigma=5., method='lm',
+                      max_residual=1., max_stderr=0.01, guess=None):
+    """Fit a Gaussian to every step-th row of pixels, and to others as needed.
+
+    A line through the centers only needs enough well-distributed points.
+    First fit every step-th row and a line through their centers. Then fit
+    the rows around any fit that deviates from the line by more than
+    max_residual pixels, or that failed between good fits, and repeat. If
+    the standard error of the slope exceeds max_stderr, fit all rows.
+
+    Parameters
+    ----------
+    image : image array
+    step : int, default 4
+    guess_sigma : initial guess for Gaussian width
+    method : {'lm', 'logparabola'}; see fit_rows
+    max_residual : float, default 1.
+        in pixels
+    max_stderr : float, default 0.01
+        standard error of the slope d(x0)/d(row)
+    guess : optional initial guesses for each row; see fit_rows
+
+    Returns
+    -------
+    fits, covs, n_fit
+        like fit_rows, with NaN for rows that were not fit, and the number
+        of rows that were fit
+    """
+    image = np.asarray(image)
+    nrows = image.shape[0]
+    fits = np.full((nrows, 3), np.nan)
+    covs = np.full((nrows, 3, 3), np.nan)
+    fitted = np.zeros(nrows, dtype=bool)
+    todo = np.zeros(nrows, dtype=bool)
+    todo[::step] = True
+    while todo.any():
+        rows = np.flatnonzero(todo)
+        fits[rows], covs[rows] = fit_rows(
+            image[rows], guess_sigma, method,
+            guess=None if guess is None else np.asarray(guess)[rows])
+        fitted |= todo
+        good = _well_fit(fits)
+        if good.sum() < 3:
+            todo = ~fitted
+            continue
+        slope, intercept, stderr = fit_center_line(
+            np.where(good, fits[:, 2], np.nan), covs[:, 2, 2])
+        if not stderr <= max_stderr:
+            todo = ~fitted
+            continue
+        residual = fits[:, 2] - (intercept + slope*np.arange(nrows))
+        good_rows = np.flatnonzero(good)
+        interior = np.zeros(nrows, dtype=bool)
+        interior[good_rows[0]:good_rows[-1] + 1] = True
+        with np.errstate(invalid='ignore'):
+            suspect = fitted & interior & ~(good & (np.abs(residual) <=
+                                                    max_residual))
+        nearby = ndimage.maximum_filter1d(suspect, 2*step - 1)
+        todo = nearby & ~fitted
+    return fits, covs, fitted.sum()
+
+
+def _fit(image, guess_sigma, method, step, guess=None):
+    """Fit all rows, or a subset if step > 1. Return fits, covs, and the
+    number of rows fit."""
+    if step > 1:
+        return fit_rows_adaptive(image, step, guess_sigma, method,
+                                 guess=guess)
+    fits, covs = fit_rows(image, guess_sigma, method, guess=guess)
+    return fits, covs, len(fits)
+
+
+def fit_center_line(x0, variance=None, robust=True, max_iterations=20,
+                    tuning=4.685, variance_floor=0.1):
+    """Fit a line, x0 = intercept + slope*row, to the centers of the rows.
+
+    The fit is weighted by the inverse variance of each center, if given,
+    and made robust to outliers (e.g., bad fits at the tips of the wire) by
+    iteratively reweighting with Tukey's biweight. The reweighting starts
+    from Siegel's repeated median line, which ignores up to half of the
+    centers, so fits to noise past the ends of the wire cannot steer it
+    to a wrong line. The biweights come from the unweighted residuals, so
+    that an outlier with a tiny variance, like a fit to a single noise
+    spike, cannot pin the line to itself.
+
+    Parameters
+    ----------
+    x0 : array with shape (..., rows) of centers, NaN where there is no fit
+        Leading dimensions hold independent lines, which are fit at once.
+    variance : optional array like x0, e.g., covs[..., 2, 2] from fit_rows
+    robust : boolean, default True
+    max_iterations : maximum number of reweighting iterations, 20 by default
+    tuning : Tukey biweight tuning constant, in units of the robust
+        standard deviation of the residuals; 4.685 by default
+    variance_floor : float, default 0.1
+        Variances below this fraction of the median variance of a line are
+        raised to it, which caps the weight of any one center.
+
+    Returns
+    -------
+    slope, intercept, slope_err
+        slope_err is the standard error of the slope. Lines with fewer than
+        three usable points are NaN.
+    """
+    x0 = np.asarray(x0, dtype=float)
+    row = np.arange(x0.shape[-1], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if variance is None:
+            w = np.ones_like(x0)
+        else:
+            variance = np.asarray(variance, dtype=float)
+            usable = np.isfinite(x0) & np.isfinite(variance) & (variance > 0)
+            typical = np.nanmedian(np.where(usable, variance, np.nan),
+                                   axis=-1)
+            w = 1 / np.maximum(variance,
+                               variance_floor*typical[..., np.newaxis])
+        valid = np.isfinite(x0) & np.isfinite(w) & (w > 0)
+    w = np.where(valid, w, 0)
+    x0 = np.where(valid, x0, 0)
+
+    def weighted_fit(weights):
+        S = weights.sum(-1)
+        Sx = (weights*row).sum(-1)
+        Sy = (weights*x0).sum(-1)
+        Sxx = (weights*row**2).sum(-1)
+        Sxy = (weights*row*x0).sum(-1)
+        D = S*Sxx - Sx**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (S*Sxy - Sx*Sy) / D
+            intercept = (Sy - slope*Sx) / S
+            return slope, intercept, S / D
+
+    def residuals(slope, intercept):
+        return x0 - intercept[..., np.newaxis] - slope[..., np.newaxis]*row
+
+    def repeated_median():
+        # The median over rows of the median slope to every other row
+        pairs = valid[..., :, np.newaxis] & valid[..., np.newaxis, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = ((x0[..., :, np.newaxis] - x0[..., np.newaxis, :]) /
+                      (row[:, np.newaxis] - row))
+        pairs &= np.isfinite(slopes)
+        # Rows with no pairs get zeros, and then NaN, to keep nanmedian
+        # from warning about them.
+        paired = pairs.any(-1)
+        slopes = np.where(pairs, slopes,
+                          np.where(paired[..., np.newaxis], np.nan, 0))
+        median_slopes = np.where(paired, np.nanmedian(slopes, axis=-1),
+                                 np.nan)
+        slope = np.nanmedian(median_slopes, axis=-1)
+        intercept = np.nanmedian(np.where(
+            valid, x0 - slope[..., np.newaxis]*row, np.nan), axis=-1)
+        return slope, intercept
+
+    robust_w = valid.astype(float)
+    slope, intercept, slope_var = weighted_fit(w)
+    if robust:
+        slope, intercept = repeated_median()
+    for i in range(max_iterations if robust else 0):
+        r = residuals(slope, intercept)
+        with np.errstate(invalid='ignore'):
+            scale = 1.4826 * np.nanmedian(np.where(valid, np.abs(r), np.nan),
+                                          axis=-1)
+            scale = np.where(scale > 0, scale, np.finfo(float).tiny)
+            u = r / (tuning*scale[..., np.newaxis])
+            new_w = np.where(valid & (np.abs(u) < 1), (1 - u**2)**2, 0)
+        if i > 0 and np.allclose(new_w, robust_w):
+            break
+        robust_w = new_w
+        slope, intercept, slope_var = weighted_fit(w*robust_w)
+    weights = w*robust_w
+    dof = (weights > 0).sum(-1) - 2
+    chi2 = (weights*residuals(slope, intercept)**2).sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope_err = np.sqrt(slope_var * chi2 / dof)
+    too_few = valid.sum(-1) < 3
+    slope, intercept, slope_err = [np.where(too_few, np.nan, a)[()] for a in
+                                   (slope, intercept, slope_err)]
+    return slope, intercept, slope_err
 
 
-def infer_angle_from_centers(x0):
-    "Fit a line to the center positions in each row and compute its angle."
-    x0 = Series(x0).dropna()
-    len_x0 = len(x0)
+def infer_angle_from_centers(x0, variance=None, robust=True):
+    """Fit a line to the center positions in each row and compute its angle.
+
+    Parameters
+    ----------
+    x0 : array of centers, NaN where there is no fit
+    variance : optional array of the variance of each center
+    robust : boolean, default True; see fit_center_line
+
+    Returns
+    -------
+    angle, angle_err
+        the angle of the line from the vertical, in [0, pi), and its
+        standard error, both in radians
+    """
+    x0 = np.asarray(x0, dtype=float)
+    len_x0 = np.isfinite(x0).sum()
     if len_x0 < 3:
         raise ValueError("Only {0} points were successfully fit.".format(len_x0))
-    y = x0.index.values.astype(int)
-    slope, intercept, r_value, p_value, std_err = linregress(x0, y)
-    angle = np.pi/2 - np.arctan(slope)
-    print np.rad2deg(angle)
-    return angle
+    slope, intercept, slope_err = fit_center_line(x0, variance, robust)
+    angle = np.mod(np.arctan(slope), np.pi)
+    angle_err = slope_err / (1 + slope**2)
+    return angle, angle_err
+
+
+def _well_fit(fits, min_amplitude=0.5):
+    """Flag rows with a usable fit.
+
+    Rows whose fitted amplitude is less than min_amplitude times that of
+    a typical bright row (the 90th percentile), e.g., beyond the ends of
+    the wire, are rejected.
+    """
+    good = np.isfinite(fits).all(axis=1)
+    if good.any():
+        A = fits[:, 0]
+        good &= A >= min_amplitude*np.percentile(A[good], 90)
+    return good
+
+
+def _center_slope(fits, covs, good):
+    "Fit a line to the center positions of good rows; return d(x0)/d(row)."
+    if good.sum() < 3:
+        raise ValueError("Only {0} points were successfully fit.".format(
+            good.sum()))
+    x0 = np.where(good, fits[:, 2], np.nan)
+    return fit_center_line(x0, covs[:, 2, 2])[0]
+
+
+@memoize(maxsize=16)
+def _profile_grid(shape):
+    """Offsets of each pixel from the image center, along and across an
+    axis. Cached by image shape; the arrays are read-only."""
+    nrows, ncols = shape
+    along, across = np.meshgrid(np.arange(nrows) - (nrows - 1) / 2.,
+                                np.arange(ncols) - (ncols - 1) / 2.,
+                                indexing='ij')
+    along.flags.writeable = False
+    across.flags.writeable = False
+    return along, across
+
+
+def sample_profiles(image, angle):
+    """Sample intensity profiles perpendicular to a tilted axis.
+
+    Parameters
+    ----------
+    image : image array
+    angle : tilt of the axis from the vertical, in radians
+
+    Returns
+    -------
+    profiles : array with the shape of image
+        Row i is the profile across the axis, i rows along it from the top.
+        At zero angle, this is the image itself. Points that fall outside
+        the image are zero.
+    """
+    along, across = _profile_grid(image.shape)
+    c, s = np.cos(angle), np.sin(angle)
+    rows = (image.shape[0] - 1) / 2. + along*c - across*s
+    cols = (image.shape[1] - 1) / 2. + along*s + across*c
+    return ndimage.map_coordinates(image, [rows, cols], order=1, cval=0.)
 
 
 class ConvergenceError(Exception):
     pass
 
 
-def analyze(image, guess_sigma=3., max_iterations=20):
+def _refine_by_sampling(image, guess_sigma, method, step, max_iterations,
+                        tolerance, angle=0., guess=None):
+    """Iteratively fit profiles across the axis, starting from angle.
+
+    Returns the (unwrapped) angle, the fits of the last profiles (NaN where
+    the fit was poor), the number of iterations used, and the total number
+    of rows fit over all iterations.
+    """
+    rows_fit = 0
+    for i in range(max_iterations + 1):
+        profiles = sample_profiles(image, angle)
+        fits, covs, n_fit = _fit(profiles, guess_sigma, method, step, guess)
+        rows_fit += n_fit
+        good = _well_fit(fits)
+        correction = np.arctan(_center_slope(fits, covs, good))
+        angle += correction
+        # Seed the next iteration with the good fits only.
+        guess = np.where(good[:, np.newaxis], fits, np.nan)
+        if np.abs(correction) < tolerance:
+            return angle, guess, i + 1, rows_fit
+    raise ConvergenceError(
+        "After {0} iterations, the angle did not converge.".format(
+            max_iterations))
+
+
+def analyze(image, guess_sigma=3., max_iterations=20, method='lm',
+            refine='rotate', tolerance=1e-3, step=1, full_output=False):
     """Discern the orientation of an elongated object in an image.
 
     Fit a Gaussian to each row of image, and fit a line along their
@@ -58,29 +456,159 @@ def analyze(image, guess_sigma=3., max_iterations=20):
     image : image array
     guess_sigma : initial guess for Gaussian width of wire
     max_iterations : number of times to rotate image retry fit, 20 by default
+    method : method used to fit the rows, 'lm' by default; see fit_rows
+    refine : {'rotate', 'sample'}
+        'rotate' (default) rotates the whole image after each fit.
+        'sample' never resamples the image: it samples profiles across the
+        current estimate of the axis directly from the original image (see
+        sample_profiles) and fits only those. The angle is accumulated
+        analytically, so interpolation blur does not compound.
+    tolerance : float, default 1e-3
+        For 'sample', stop when the correction to the angle is smaller
+        than this, in radians.
+    step : int, default 1
+        If greater than 1, fit only every step-th row, and other rows where
+        the line fit calls for them; see fit_rows_adaptive.
+    full_output : boolean, default False
+        If True, also return the total number of rows fit, over all
+        rotations or refinements, to gauge the savings of step.
 
     Returns 
     -------
     Series with 'x' center, 'y' center, and 'angle' in radians
+    If full_output, a tuple: that Series, and the number of rows fit
 
     Note
     ----
     This technique does not find the center of the wire.
     The center x, y is just the center of the ROI.
     """
-    fits = fit_rows(image, guess_sigma)
-    x0 = fits[:, 2]
-    angle = infer_angle_from_centers(x0)
+    center = [image.shape[1] // 2, image.shape[0] // 2]
+    if refine == 'sample':
+        total_angle, fits, iterations, rows_fit = _refine_by_sampling(
+            image, guess_sigma, method, step, max_iterations, tolerance)
+        total_angle = np.mod(total_angle, np.pi)
+        result = Series(center + [total_angle], index=['x', 'y', 'angle'])
+        return (result, rows_fit) if full_output else result
+    elif refine != 'rotate':
+        raise ValueError("Unknown refine option {0}".format(refine))
+    fits, covs, rows_fit = _fit(image, guess_sigma, method, step)
+    x0 = np.where(_well_fit(fits), fits[:, 2], np.nan)
+    angle, angle_err = infer_angle_from_centers(x0, covs[:, 2, 2])
     total_angle = angle
     i = 0
     while np.abs(angle) > 5:
         image = transform.rotate(image, -angle)
-        fits = fit_rows(image, guess_sigma)
-        angle = infer_angle_from_centers(fits[:, 2])
+        fits, covs, n_fit = _fit(image, guess_sigma, method, step)
+        rows_fit += n_fit
+        x0 = np.where(_well_fit(fits), fits[:, 2], np.nan)
+        angle, angle_err = infer_angle_from_centers(x0, covs[:, 2, 2])
         total_angle += angle
         if i > max_iterations:
             raise ConvergenceError(
                 "After {0} consecutive rotations, the image could not be "
                 "aligned to the vertical.".format(max_iterations))
         i += 1
-    return Series(total_angle, image.shape[0] // 2, image.shape[1] // 2)
+    result = Series(center + [total_angle], index=['x', 'y', 'angle'])
+    return (result, rows_fit) if full_output else result
+
+
+class GaussianTracker(object):
+    """Analyze consecutive video frames, warm-starting each from the last.
+
+    Consecutive frames are nearly identical, so the previous frame's angle
+    and per-row fits make good initial guesses. Each frame is analyzed like
+    analyze(image, refine='sample'), starting from the previous angle and
+    seeding each row's fit with the previous frame's fit of that row.
+
+    Parameters
+    ----------
+    guess_sigma : initial guess for Gaussian width of wire
+    method : method used to fit the rows, 'lm' by default; see fit_rows
+    max_iterations : maximum number of refinements per frame, 20 by default
+    tolerance : convergence tolerance on the angle, in radians
+    step : fit every step-th row, and others as needed; see analyze
+
+    Attributes
+    ----------
+    iterations : number of refinements used on the last frame
+    rows_fit : number of rows fit on the last frame, over all refinements
+
+    Example
+    -------
+    >>> tracker = GaussianTracker()
+    >>> trajectory = DataFrame([tracker(*prepare(frame)[::-1])
+    ...                         for frame in frames])
+    """
+    def __init__(self, guess_sigma=3., method='lm', max_iterations=20,
+                 tolerance=1e-3, step=1):
+        self.guess_sigma = guess_sigma
+        self.method = method
+        self.step = step
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        "Forget the previous frame."
+        self.angle = 0.
+        self.fits = None
+        self.shape = None
+        self.roi = None
+        self.iterations = None
+        self.rows_fit = None
+
+    def _carry_over(self, shape, roi):
+        """Map the previous frame's fits onto the rows of this frame's
+        profiles, accounting for any shift of the ROI."""
+        if self.fits is None or shape != self.shape:
+            return None
+        if roi is None or self.roi is None:
+            return self.fits
+        dr, dc = [(new.start or 0) - (old.start or 0)
+                  for new, old in zip(roi, self.roi)]
+        c, s = np.cos(self.angle), np.sin(self.angle)
+        guess = np.full_like(self.fits, np.nan)
+        shift = int(round(dr*c + dc*s))  # along the axis, in rows
+        n = len(guess)
+        if shift >= 0:
+            guess[:n - shift] = self.fits[shift:]
+        else:
+            guess[-shift:] = self.fits[:n + shift]
+        guess[:, 2] += dr*s - dc*c  # across the axis
+        return guess
+
+    def __call__(self, image, roi=None):
+        """Analyze the next frame.
+
+        Parameters
+        ----------
+        image : image array, e.g., a processed ROI
+        roi : optional tuple of slices locating image in the full frame
+            If given, x and y are reported in full-frame coordinates.
+
+        Returns
+        -------
+        Series with 'x' center, 'y' center, and 'angle' in radians
+        """
+        guess = self._carry_over(image.shape, roi)
+        start = self.angle if guess is not None else 0.
+        try:
+            angle, fits, iterations, rows_fit = _refine_by_sampling(
+                image, self.guess_sigma, self.method, self.step,
+                self.max_iterations, self.tolerance, start, guess)
+        except (ConvergenceError, ValueError):
+            if guess is None:
+                self.reset()
+                raise
+            # The warm start led astray; start over from scratch.
+            self.reset()
+            return self(image, roi)
+        self.angle, self.fits, self.iterations = angle, fits, iterations
+        self.rows_fit = rows_fit
+        self.shape, self.roi = image.shape, roi
+        x, y = image.shape[1] // 2, image.shape[0] // 2
+        if roi is not None:
+            x += roi[1].start or 0
+            y += roi[0].start or 0
+        return Series([x, y, np.mod(angle, np.pi)], index=['x', 'y', 'angle'])
@@ -0,0 +1,158 @@
+import weakref
+from collections import Counter
+from ._cache import LRUCache
+from .preprocessing import threshold, primary_object, _blur, _mask_background
+
+
+class Pipeline(object):
+    """Preprocess images like prepare, caching the output of each stage.
+
+    The stages are threshold, roi, crop, blur and mask, in that order. Each
+    output is cached, keyed by the identity of the input image and by the
+    parameters of that stage and of all the stages before it. After a
+    parameter is changed, only the stages from that one on are run again.
+    For example, sweeping mask_sigma over a set of frames finds the ROI and
+    blurs each frame only once.
+
+    Parameters
+    ----------
+    primary_sigma, padding, blur_sigma, mask_sigma, gentle_mask : see prepare
+        They may be changed at any time, as attributes.
+    maxsize : int, default 512
+        maximum number of cached stage outputs, least recently used first
+        out. The outputs of the threshold stage are full-frame masks, so
+        mind the memory with large frames.
+
+    Attributes
+    ----------
+    runs : Counter of the number of times each stage was computed
+
+    Note
+    ----
+    Images are identified by the object itself, as long as it is alive, not
+    by its contents. Do not modify an image in place between calls, and do
+    not modify the arrays returned. If each call gets a new array for the
+    same image, e.g., a fresh slice of a video, pass a key instead.
+
+    Example
+    -------
+    >>> pipeline = Pipeline()
+    >>> for mask_sigma in [-1, -0.5, 0]:
+    ...     pipeline.mask_sigma = mask_sigma
+    ...     results = [pipeline(frame, key=i) for i, frame in enumerate(frames)]
+    """
+    stages = ('threshold', 'roi', 'crop', 'blur', 'mask')
+
+    def __init__(self, primary_sigma=3, padding=0.03, blur_sigma=1,
+                 mask_sigma=-0.5, gentle_mask=True, maxsize=512):
+        self.primary_sigma = primary_sigma
+        self.padding = padding
+        self.blur_sigma = blur_sigma
+        self.mask_sigma = mask_sigma
+        self.gentle_mask = gentle_mask
+        self.cache = LRUCache(maxsize)
+        self.runs = Counter()
+        self._tokens = {}  # id(image) -> (weak reference, token)
+        self._next_token = 0
+
+    def clear(self):
+        "Empty the cache."
+        self.cache.clear()
+        self._tokens.clear()
+
+    def _parameters(self, stage):
+        "The parameters that determine the output of a stage."
+        if stage == 'threshold':
+            return (self.primary_sigma,)
+        elif stage == 'roi':
+            return (self.padding,)
+        elif stage == 'crop':
+            return ()
+        elif stage == 'blur':
+            return (self.blur_sigma,)
+        elif stage == 'mask':
+            return (self.mask_sigma, self.gentle_mask)
+        raise ValueError("unknown stage {0}".format(stage))
+
+    def _token(self, image):
+        "Identify an image for as long as it is alive."
+        key = id(image)
+        entry = self._tokens.get(key)
+        if entry is not None and entry[0]() is image:
+            return entry[1]
+        tokens = self._tokens
+
+        def forget(ref):
+            if tokens.get(key, (None,))[0] is ref:
+                del tokens[key]
+
+        try:
+            ref = weakref.ref(image, forget)
+        except TypeError:
+            return None  # cannot tell if it is the same image later
+        token = self._next_token
+        self._next_token += 1
+        tokens[key] = (ref, token)
+        return token
+
+    def _compute(self, stage, image, upstream):
+        "Run one stage on the output of the stage before it."
+        if stage == 'threshold':
+            return threshold(image, self.primary_sigma)
+        elif stage == 'roi':
+            return primary_object(upstream, self.padding)
+        elif stage == 'crop':
+            return image[upstream]
+        elif stage == 'blur':
+            if not self.blur_sigma:
+                return upstream  # the raw pixels, as in prepare
+            return _blur(upstream, self.blur_sigma)
+        elif stage == 'mask':
+            if not self.mask_sigma:
+                return upstream
+            return _mask_background(upstream.astype(float), self.mask_sigma,
+                                    self.gentle_mask)
+
+    def run(self, image, stage='mask', key=None):
+        """Return the output of a stage, running it and those before it as
+        needed.
+
+        Parameters
+        ----------
+        image : grayscale image array
+        stage : {'threshold', 'roi', 'crop', 'blur', 'mask'}
+        key : hashable, optional
+            identifies the image in the cache instead of the image object
+
+        Returns
+        -------
+        output of the stage: a mask, an roi (tuple of slices) or an image
+        """
+        if stage not in self.stages:
+            raise ValueError("unknown stage {0}".format(stage))
+        if key is None:
+            token = self._token(image)
+        else:
+            token = ('key', key)
+        output = None
+        parameters = ()
+        for name in self.stages[:self.stages.index(stage) + 1]:
+            parameters += self._parameters(name)
+            cache_key = (name, token, parameters)
+            if token is not None and cache_key in self.cache:
+                output = self.cache[cache_key]
+            else:
+                output = self._compute(name, image, output)
+                self.runs[name] += 1
+                if token is not None:
+                    self.cache[cache_key] = output
+        return output
+
+    def __call__(self, image, key=None):
+        """Prepare an image, like prepare.
+
+        Returns
+        -------
+        a tuple: roi, processed_image
+        """
+        return self.run(image, 'roi', key), self.run(image, 'mask', key)
@@ -1,4 +1,5 @@
 import numpy as np
+from .covariance import shape_descriptors
 
 
 def video(fname, mimetype):
@@ -81,14 +82,17 @@ def plot_principal_axes(img, x_bar, y_bar, cov, ax=None):
     import matplotlib.pyplot as plt
     if ax is None:
         fig, ax = plt.subplots()
-    def make_lines(eigvals, eigvecs, mean, i):
+    def make_lines(eigval, axis, mean):
         """Make lines a length of 2 stddev."""
-        std = np.sqrt(eigvals[i])
-        vec = 2 * std * eigvecs[:,i] / np.hypot(*eigvecs[:,i])
+        vec = 2 * np.sqrt(eigval) * axis
         x, y = np.vstack((mean-vec, mean, mean+vec)).T
         return x, y
     mean = np.array([x_bar, y_bar])
-    eigvals, eigvecs = np.linalg.eigh(cov)
-    ax.plot(*make_lines(eigvals, eigvecs, mean, 0), marker='o', color='white')
-    ax.plot(*make_lines(eigvals, eigvecs, mean, -1), marker='o', color='red')
+    shape = shape_descriptors(cov)
+    major_axis = np.array([np.cos(shape['angle']), np.sin(shape['angle'])])
+    minor_axis = np.array([-major_axis[1], major_axis[0]])
+    ax.plot(*make_lines(shape['minor'], minor_axis, mean), marker='o',
+            color='white')
+    ax.plot(*make_lines(shape['major'], major_axis, mean), marker='o',
+            color='red')
     ax.imshow(img)
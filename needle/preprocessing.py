@@ -11,28 +11,119 @@ def threshold(image, sigma=3):
     sigma: float, default 3.0
         minimum brightness in terms of standard deviations above the mean
     """
-    mask = image > (image.mean() + sigma*image.std())
+    mask = image > _threshold_level(image, sigma)
     return mask
 
-def primary_object(mask, padding=0.03):
+def _threshold_level(image, sigma):
+    "The brightness threshold used by threshold."
+    return image.mean() + sigma*image.std()
+
+def _largest_object(mask, downsample=None):
+    """Find the largest connected region of a mask.
+
+    If downsample is an integer factor, find the largest region of a
+    block-reduced mask first, and then label at full resolution only the
+    pixels in that region's blocks. See primary_object.
+
+    Returns its bounding box, a tuple of slice objects, and its size in
+    pixels; or None, 0 if the mask is empty.
+    """
+    if downsample and downsample > 1:
+        region = _coarse_region(mask, downsample)
+        if region is None:
+            return None, 0
+        roi, size = _largest_object(mask[region])
+        return tuple(slice(s.start + r.start, s.stop + r.start)
+                     for s, r in zip(roi, region)), size
+    label_im, nb_labels = ndimage.label(mask)
+    if not nb_labels:
+        return None, 0
+    sizes = np.bincount(label_im.ravel())
+    sizes[0] = 0  # background
+    big_label = sizes.argmax() # the label of the largest connection region
+    roi = ndimage.find_objects(label_im, big_label)[big_label - 1]
+    return roi, sizes[big_label]
+
+def _coarse_region(mask, factor):
+    """Find the largest region of a mask reduced by factor x factor blocks.
+
+    Each block counts the True pixels in it. Return the full-resolution
+    bounding box of the blocks of the region with the most pixels, or None
+    if the mask is empty.
+    """
+    nrows, ncols = mask.shape
+    padded = np.pad(mask, ((0, -nrows % factor), (0, -ncols % factor)),
+                    mode='constant')
+    counts = padded.reshape(padded.shape[0] // factor, factor,
+                            padded.shape[1] // factor, factor)
+    counts = counts.sum(axis=3, dtype=np.int32).sum(axis=1)
+    label_im, nb_labels = ndimage.label(counts > 0)
+    if not nb_labels:
+        return None
+    sizes = np.bincount(label_im.ravel(), weights=counts.ravel())
+    sizes[0] = 0
+    big_label = sizes.argmax()
+    blocks = ndimage.find_objects(label_im, big_label)[big_label - 1]
+    return tuple(slice(b.start*factor, min(b.stop*factor, n))
+                 for b, n in zip(blocks, mask.shape))
+
+def primary_object(mask, padding=0.03, downsample=None):
     """Identify the largest connected region and return the roi.
 
     Parameters
     ----------
     mask: binary (thresholded) image
     padding: fractional padding of ROI (default 0.02)
+    downsample: integer factor, optional
+        If given, label a copy of the mask reduced by blocks of this size to
+        find the candidate region, then refine the ROI at full resolution
+        inside that region only. Labeling cost scales with pixel count, so
+        this pays off on large images.
 
     Returns
     -------
     padded_roi: a tuple of slice objects
+
+    Note
+    ----
+    A connected region at full resolution is always contained in a single
+    connected region of the reduced mask, and the ROI is refined at full
+    resolution, so the result is exactly the same as without downsampling
+    whenever the regions of the mask are more than 2*downsample pixels
+    apart. Closer regions may be merged in the reduced mask, in which case
+    the largest region within the merged candidate is returned.
     """
-    label_im, nb_labels = ndimage.label(mask)
-    sizes = ndimage.sum(mask, label_im, range(nb_labels + 1))
-    big_label = sizes.argmax() # the label of the largest connection region
-    roi = ndimage.find_objects(label_im==big_label)[0]
+    roi, size = _largest_object(mask, downsample)
+    if roi is None:
+        roi = tuple(slice(0, n) for n in mask.shape)
     padded_roi = pad_roi(roi, padding, mask.shape)
     return padded_roi
 
+def find_objects(mask, n=None, min_size=1, padding=0.03):
+    """Identify all the connected regions above a size, and return ROIs.
+
+    The mask is labeled once, however many regions are kept.
+
+    Parameters
+    ----------
+    mask: binary (thresholded) image
+    n: maximum number of regions to keep, largest first; default all
+    min_size: minimum size of a region, in pixels, default 1
+    padding: fractional padding of each ROI (default 0.03)
+
+    Returns
+    -------
+    padded_rois: a list of tuples of slice objects, largest region first
+    """
+    label_im, nb_labels = ndimage.label(mask)
+    if not nb_labels:
+        return []
+    sizes = np.bincount(label_im.ravel())[1:]
+    order = np.argsort(-sizes, kind='mergesort')  # stable: ties by label
+    order = order[sizes[order] >= min_size][:n]
+    objects = ndimage.find_objects(label_im)
+    return [pad_roi(objects[i], padding, mask.shape) for i in order]
+
 def pad_roi(roi, padding, img_shape):
     "Pad x and y slices, within the bounds of img_shape."
     s0, s1 = roi # slices in x and y
@@ -44,8 +135,100 @@ def pad_roi(roi, padding, img_shape):
     return new_s0, new_s1
 
 
+def _blur(image, sigma):
+    "Gaussian blur, as floats, as used by prepare."
+    return filter.gaussian_filter(image.astype(float), sigma)
+
+
+def _footprint(image, blur_sigma, mask_sigma):
+    "Pixels of an ROI that prepare keeps as the object, flanks and all."
+    if blur_sigma:
+        image = _blur(image, blur_sigma)
+    return threshold(image, mask_sigma or 0)
+
+
+def _mask_background(image, sigma, gentle_mask=True):
+    "Suppress pixels below a threshold, as used by prepare."
+    if gentle_mask:
+        background = np.exp(-image/image.max())
+    else:
+        background = np.zeros(image.shape)
+    return np.where(threshold(image, sigma), image, background)
+
+
+class Workspace(object):
+    """Reusable buffers for prepare, to avoid allocating arrays every frame.
+
+    The buffers are flat arrays that grow only when an ROI holds more
+    pixels than any before it. Each call to prepare hands back a view into
+    them, which is overwritten by the next call: copy it to keep it.
+
+    Parameters
+    ----------
+    dtype : floating point type of the buffers, default float32
+
+    Attributes
+    ----------
+    capacity : number of pixels the buffers hold
+    allocations : number of times the buffers were (re)allocated
+
+    Example
+    -------
+    >>> workspace = Workspace()
+    >>> for frame in frames:
+    ...     roi, processed = prepare(frame, workspace=workspace)
+    """
+    def __init__(self, dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self.capacity = 0
+        self.allocations = 0
+
+    def buffers(self, shape):
+        """Return image, blurred, scratch and mask arrays of a given shape.
+
+        The first three have the workspace dtype; mask is boolean.
+        """
+        size = int(np.prod(shape))
+        if size > self.capacity:
+            self._image = np.empty(size, self.dtype)
+            self._blurred = np.empty(size, self.dtype)
+            self._scratch = np.empty(size, self.dtype)
+            self._mask = np.empty(size, bool)
+            self.capacity = size
+            self.allocations += 1
+        return tuple(b[:size].reshape(shape) for b in
+                     (self._image, self._blurred, self._scratch, self._mask))
+
+
+def _process_into(image, workspace, blur_sigma, mask_sigma, gentle_mask):
+    "Blur and mask an ROI like prepare, writing into a Workspace."
+    raw, blurred, scratch, mask = workspace.buffers(image.shape)
+    np.copyto(raw, image, casting='unsafe')
+    if blur_sigma:
+        ndimage.gaussian_filter(raw, blur_sigma, output=blurred,
+                                mode='nearest')
+    else:
+        blurred = raw
+    if not mask_sigma:
+        return blurred
+    # Threshold level, as in threshold, without a temporary for the std
+    mean = blurred.mean()
+    np.subtract(blurred, mean, out=scratch)
+    np.multiply(scratch, scratch, out=scratch)
+    level = mean + mask_sigma*np.sqrt(scratch.mean())
+    np.less_equal(blurred, level, out=mask)  # the background
+    if gentle_mask:
+        np.multiply(blurred, -1./blurred.max(), out=scratch)
+        np.exp(scratch, out=scratch)
+        np.copyto(blurred, scratch, where=mask)
+    else:
+        np.copyto(blurred, 0, where=mask)
+    return blurred
+
+
 def prepare(image, primary_sigma=3, padding=0.03,
-            blur_sigma=1, mask_sigma=-0.5, gentle_mask=True):
+            blur_sigma=1, mask_sigma=-0.5, gentle_mask=True, roi=None,
+            downsample=None, background=None, workspace=None):
     """Prepare the image using a sequence of standard preprocessing operations.
     
     1. Identify the primary object (largest connected region).
@@ -58,26 +241,417 @@ def prepare(image, primary_sigma=3, padding=0.03,
     image : grayscale image array
     primary_sigma : sigma used in initial threshold operation to isolate object
     padding : relative padding of ROI around object
-    blur_sigma : Gaussian blur sigma
+    blur_sigma : Gaussian blur sigma; if 0 or None, do not blur
     mask_sigma : sigma used in final threshold to crush near-black regions
+        If 0 or None, do not mask. If neither blurring nor masking, the
+        processed image is a view of the original, with its original dtype.
     gentle_mask : boolean
         If True (default) crush background to full black. If False, suppress
         background like exp(-brightness/max_brightness_in_image).
+    roi : tuple of slices, optional
+        If given, use this ROI instead of searching for the primary object,
+        e.g., the output of an ROITracker.
+    downsample : integer factor for a coarse-to-fine search for the primary
+        object; see primary_object
+    background : BackgroundModel, optional
+        If given, subtract the background from the image before
+        thresholding, and then update the model with the image, leaving
+        out the pixels of the ROI that the final mask keeps, i.e. the
+        object with its blurred flanks (with no mask_sigma, the pixels
+        brighter than the mean of the ROI after blurring). They
+        are not learned from the first image either, so a still object is
+        not subtracted from itself. An object larger than the primary one
+        in the first image is taken for the primary object until it is
+        learned, which is quicker if the model is primed with frames of the
+        empty field of view.
+    workspace : Workspace, optional
+        If given, process the ROI in the workspace's preallocated buffers,
+        in its dtype (float32 by default), with no new arrays in the steady
+        state. The processed image is then a view into the workspace,
+        overwritten by the next call.
 
     Returns
     -------
     a tuple: roi, processed_image
     """
 
-    roi = primary_object(threshold(image, primary_sigma), padding)
-    image = image[roi].astype(float)
-    blurred = filter.gaussian_filter(image, blur_sigma)
+    if background is not None:
+        frame, image = image, background.subtract(image)
+    if roi is None:
+        roi = primary_object(threshold(image, primary_sigma), padding,
+                             downsample)
+    if background is not None:
+        exclude = np.zeros(image.shape, dtype=bool)
+        exclude[roi] = _footprint(image[roi], blur_sigma, mask_sigma)
+        background.update(frame, exclude=exclude)
+    image = image[roi]
+    if not (blur_sigma or mask_sigma):
+        # Hand back a view of the raw pixels, in their original dtype, so
+        # covariance.moments(..., exact=True) can sum them as integers.
+        return roi, image
+    if workspace is not None:
+        return roi, _process_into(image, workspace, blur_sigma, mask_sigma,
+                                  gentle_mask)
+    if blur_sigma:
+        blurred = _blur(image, blur_sigma)
+    else:
+        blurred = image.astype(float)
     if mask_sigma:
-        if gentle_mask:
-            background = np.exp(-blurred/blurred.max())
-        else:
-            background = np.zeros_like(blurred)
-        masked = np.where(threshold(blurred, mask_sigma), blurred, background)
-        return roi, masked
+        return roi, _mask_background(blurred, mask_sigma, gentle_mask)
     else:
         return roi, blurred
+
+
+def prepare_objects(image, primary_sigma=3, padding=0.03, blur_sigma=1,
+                    mask_sigma=-0.5, gentle_mask=True, n=None, min_size=1):
+    """Prepare each of the objects in an image, like prepare.
+
+    The image is thresholded and labeled once, for all the objects.
+
+    Parameters
+    ----------
+    n : maximum number of objects, largest first; default all
+    min_size : minimum size of an object, in pixels, in the initial threshold
+    other parameters : see prepare
+
+    Returns
+    -------
+    a list of tuples: roi, processed_image, largest object first
+
+    Note
+    ----
+    The padded ROIs of nearby objects may overlap, in which case part of one
+    object can appear in the processed image of another.
+    """
+    rois = find_objects(threshold(image, primary_sigma), n, min_size, padding)
+    return [prepare(image, blur_sigma=blur_sigma, mask_sigma=mask_sigma,
+                    gentle_mask=gentle_mask, roi=roi) for roi in rois]
+
+
+def prepare_stack(frames, primary_sigma=3, padding=0.03,
+                  blur_sigma=1, mask_sigma=-0.5, gentle_mask=True):
+    """Prepare a stack of images, like prepare, in vectorized passes.
+
+    The threshold statistics are per-frame reductions over the whole stack,
+    the primary objects of all frames are labeled in one call, and the
+    stack is blurred in one call along the spatial axes only.
+
+    Parameters
+    ----------
+    frames : 3D array of images, shape (N, rows, columns)
+    other parameters : see prepare
+
+    Returns
+    -------
+    a tuple: bounds, processed
+        bounds is an (N, 4) integer array of ROI bounds,
+        (row start, row stop, column start, column stop), in each frame.
+        processed is an array of shape (N, max ROI rows, max ROI columns)
+        holding each frame's processed ROI at its top-left corner, padded
+        with zeros. Frame i's ROI is
+        processed[i, :stop - start, :stop - start] for the rows and columns.
+
+    Note
+    ----
+    The stack is blurred over the union of the ROIs, so near the edge of an
+    ROI the blur draws on the actual neighboring pixels instead of
+    extending the edge as prepare does.
+    """
+    frames = np.asarray(frames)
+    nframes, nrows, ncols = frames.shape
+    # Per-frame threshold statistics, as in threshold
+    level = (frames.mean(axis=(1, 2)) +
+             primary_sigma*frames.std(axis=(1, 2)))
+    mask = frames > level[:, np.newaxis, np.newaxis]
+
+    # Label all frames at once, with no connections between frames.
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, 1)
+    label_im, nb_labels = ndimage.label(mask, structure)
+    sizes = np.bincount(label_im.ravel(), minlength=nb_labels + 1)[1:]
+    objects = ndimage.find_objects(label_im)
+    bounds = np.empty((nframes, 4), dtype=int)
+    bounds[:] = [0, nrows, 0, ncols]  # if a frame has no object
+    if nb_labels:
+        extents = np.array([[s.start for s in obj] + [s.stop for s in obj]
+                            for obj in objects])  # f0, r0, c0, f1, r1, c1
+        frame_of = extents[:, 0]
+        # Sort labels by frame, then by size; the last of each is largest.
+        order = np.lexsort((sizes, frame_of))
+        last = np.r_[frame_of[order][1:] != frame_of[order][:-1], True]
+        largest = order[last]
+        bounds[frame_of[largest]] = extents[largest][:, [1, 4, 2, 5]]
+    # Pad, within the image, as in pad_roi.
+    p = int(max(nrows, ncols)*padding)
+    bounds += [-p, p, -p, p]
+    bounds[:, :2] = np.clip(bounds[:, :2], 0, nrows - 1)
+    bounds[:, 2:] = np.clip(bounds[:, 2:], 0, ncols - 1)
+
+    # Blur the union of the ROIs along the spatial axes only.
+    r0, c0 = bounds[:, 0].min(), bounds[:, 2].min()
+    union = frames[:, r0:bounds[:, 1].max(), c0:bounds[:, 3].max()]
+    union = union.astype(float)
+    if blur_sigma:
+        union = ndimage.gaussian_filter(union, (0, blur_sigma, blur_sigma),
+                                        mode='nearest')
+
+    # Gather each ROI into the top-left corner of a padded array.
+    heights = bounds[:, 1] - bounds[:, 0]
+    widths = bounds[:, 3] - bounds[:, 2]
+    rows = np.arange(heights.max())
+    cols = np.arange(widths.max())
+    valid = ((rows < heights[:, np.newaxis])[:, :, np.newaxis] &
+             (cols < widths[:, np.newaxis])[:, np.newaxis, :])
+    rr = np.minimum(bounds[:, :1] - r0 + rows, union.shape[1] - 1)
+    cc = np.minimum(bounds[:, 2:3] - c0 + cols, union.shape[2] - 1)
+    blurred = union[np.arange(nframes)[:, np.newaxis, np.newaxis],
+                    rr[:, :, np.newaxis], cc[:, np.newaxis, :]]
+    blurred[~valid] = 0
+    if not mask_sigma:
+        return bounds, blurred
+
+    # Per-frame statistics over each ROI, as in threshold
+    count = (heights*widths)[:, np.newaxis, np.newaxis]
+    mean = blurred.sum(axis=(1, 2), keepdims=True) / count
+    deviation = np.where(valid, blurred - mean, 0)
+    std = np.sqrt((deviation**2).sum(axis=(1, 2), keepdims=True) / count)
+    foreground = blurred > mean + mask_sigma*std
+    if gentle_mask:
+        peak = blurred.max(axis=(1, 2), keepdims=True)
+        background = np.exp(-blurred/peak)
+    else:
+        background = np.zeros_like(blurred)
+    masked = np.where(foreground & valid, blurred, background)
+    masked[~valid] = 0
+    return bounds, masked
+
+
+class ROITracker(object):
+    """Find the primary object in consecutive frames of a video.
+
+    The object barely moves from frame to frame, so it is sought only in a
+    window around its last position, expanded by a margin. The full frame
+    is searched only on the first frame, or when the object is lost: when
+    nothing is found in the window, when the object found there shrank
+    below min_size_ratio of its previous size, or when it touches the edge
+    of the window (and so may extend beyond it).
+
+    Parameters
+    ----------
+    primary_sigma : sigma used in the threshold to isolate the object
+    padding : relative padding of ROI around object
+    margin : int, default 20
+        expected maximum motion between frames, in pixels
+    min_size_ratio : float, default 0.5
+    downsample : integer factor for a coarse-to-fine full-frame search;
+        see primary_object
+
+    Example
+    -------
+    >>> tracker = ROITracker()
+    >>> for frame in frames:
+    ...     roi, processed = prepare(frame, roi=tracker(frame))
+    """
+    def __init__(self, primary_sigma=3, padding=0.03, margin=20,
+                 min_size_ratio=0.5, downsample=None):
+        self.primary_sigma = primary_sigma
+        self.padding = padding
+        self.margin = margin
+        self.min_size_ratio = min_size_ratio
+        self.downsample = downsample
+        self.full_searches = 0  # for diagnostics
+        self.reset()
+
+    def reset(self):
+        "Forget the object's last position."
+        self.object = None
+        self.size = 0
+
+    def _search_window(self, shape):
+        "Return the window to search, and whether it may cut the object."
+        window, edges = [], []
+        for s, n in zip(self.object, shape):
+            start = max(s.start - self.margin, 0)
+            stop = min(s.stop + self.margin, n)
+            window.append(slice(start, stop))
+            edges.append((start > 0, stop < n))
+        return tuple(window), edges
+
+    def _search_near(self, image, level):
+        window, edges = self._search_window(image.shape)
+        roi, size = _largest_object(image[window] > level)
+        if roi is None or size < self.min_size_ratio*self.size:
+            return None, 0
+        for s, w, (cut_start, cut_stop) in zip(roi, window, edges):
+            if (cut_start and s.start == 0) or \
+               (cut_stop and s.stop == w.stop - w.start):
+                return None, 0  # touches the window edge
+        roi = tuple(slice(s.start + w.start, s.stop + w.start)
+                    for s, w in zip(roi, window))
+        return roi, size
+
+    def __call__(self, image):
+        """Find the primary object in the next frame.
+
+        Returns
+        -------
+        padded_roi: a tuple of slice objects
+        """
+        level = _threshold_level(image, self.primary_sigma)
+        roi, size = None, 0
+        if self.object is not None:
+            roi, size = self._search_near(image, level)
+        if roi is None:
+            self.full_searches += 1
+            roi, size = _largest_object(image > level, self.downsample)
+        if roi is None:
+            self.reset()
+            roi = tuple(slice(0, n) for n in image.shape)
+        else:
+            self.object, self.size = roi, size
+        return pad_roi(roi, self.padding, image.shape)
+
+
+class BackgroundModel(object):
+    """Estimate the static background of a video, one frame at a time.
+
+    Dust, uneven illumination and debris that stay put in every frame are
+    learned by the model and can be subtracted before thresholding. Each
+    update takes O(pixels) time, and the model holds only a few arrays the
+    size of one frame.
+
+    Parameters
+    ----------
+    alpha : float, default 0.05
+        learning rate: roughly the inverse of the number of frames the
+        model remembers
+    method : {'mean', 'median'}
+        'mean' keeps an exponential moving average and variance of each
+        pixel. 'median' keeps an approximate running median, moved toward
+        each new value by a step of alpha times a running mean absolute
+        deviation, so it ignores occasional bright frames.
+    excluded_alpha : float, optional
+        learning rate of pixels excluded from an update (see update), which
+        drift slowly toward the current frame instead of staying frozen.
+        Default alpha/10.
+
+    Attributes
+    ----------
+    level : background brightness, or None before the first update
+    spread : running variance ('mean') or mean absolute deviation ('median')
+    frames : number of frames seen
+
+    Example
+    -------
+    >>> background = BackgroundModel()
+    >>> for frame in frames:
+    ...     roi, processed = prepare(frame, background=background)
+    """
+    def __init__(self, alpha=0.05, method='mean', excluded_alpha=None):
+        if method not in ('mean', 'median'):
+            raise ValueError("method must be 'mean' or 'median'")
+        self.alpha = alpha
+        self.method = method
+        if excluded_alpha is None:
+            excluded_alpha = alpha/10
+        self.excluded_alpha = excluded_alpha
+        self.reset()
+
+    def reset(self):
+        "Forget the background."
+        self.level = None
+        self.spread = None
+        self.frames = 0
+
+    @property
+    def std(self):
+        "Estimated standard deviation of the background of each pixel"
+        if self.spread is None:
+            return None
+        if self.method == 'mean':
+            return np.sqrt(self.spread)
+        return np.sqrt(np.pi/2)*self.spread  # mean abs. dev. of a Gaussian
+
+    def subtract(self, frame):
+        """Return the frame minus the background, as floats.
+
+        Before the first update, the background is unknown and the frame
+        is returned unchanged (as floats).
+        """
+        frame = np.asarray(frame, dtype=float)
+        if self.level is None:
+            return frame.copy()
+        if frame.shape != self.level.shape:
+            raise ValueError("frame shape {0} does not match the background "
+                             "shape {1}".format(frame.shape, self.level.shape))
+        return frame - self.level
+
+    def update(self, frame, exclude=None):
+        """Learn from a new frame.
+
+        Parameters
+        ----------
+        frame : grayscale image array
+        exclude : tuple of slices or boolean array, optional
+            pixels to leave out of the update, e.g., those of the object,
+            so that an object that barely moves is not learned as
+            background. They only drift toward the frame at the slower
+            rate excluded_alpha. On the first frame, they are filled in
+            from the nearest pixels that are not excluded.
+
+        Returns
+        -------
+        self
+        """
+        frame = np.asarray(frame, dtype=float)
+        if exclude is not None and not isinstance(exclude, np.ndarray):
+            mask = np.zeros(frame.shape, dtype=bool)
+            mask[exclude] = True
+            exclude = mask
+        if self.level is None:
+            self.level = frame.copy()
+            if exclude is not None and exclude.any() and not exclude.all():
+                nearest = ndimage.distance_transform_edt(
+                    exclude, return_distances=False, return_indices=True)
+                self.level[exclude] = frame[tuple(nearest)][exclude]
+            self.spread = np.zeros_like(self.level)
+            self._diff = np.empty_like(self.level)
+            self.frames = 1
+            return self
+        if frame.shape != self.level.shape:
+            raise ValueError("frame shape {0} does not match the background "
+                             "shape {1}".format(frame.shape, self.level.shape))
+        alpha = self.alpha
+        diff = np.subtract(frame, self.level, out=self._diff)
+        if exclude is not None:
+            excluded = diff[exclude]
+            diff[exclude] = 0
+        if self.method == 'mean':
+            # Incremental exponentially-weighted mean and variance
+            self.level += alpha*diff
+            diff **= 2
+            diff *= alpha
+            self.spread += diff
+            self.spread *= 1 - alpha
+        else:
+            # Frugal running median: step toward the new value by a fixed
+            # fraction of the spread, so outliers pull no harder than inliers.
+            deviation = np.abs(diff)
+            scale = np.where(self.spread > 0, self.spread, deviation)
+            self.level += alpha*np.sign(diff)*scale
+            if exclude is not None:
+                deviation[exclude] = self.spread[exclude]
+            deviation -= self.spread
+            self.spread += alpha*deviation
+        if exclude is not None:
+            # Drift slowly, so neither a bad start nor a lasting change in
+            # the excluded pixels is frozen in.
+            self.level[exclude] += self.excluded_alpha*excluded
+        self.frames += 1
+        return self
+
+    def __call__(self, frame, exclude=None):
+        "Subtract the background from a frame, then update the model with it."
+        foreground = self.subtract(frame)
+        self.update(frame, exclude)
+        return foreground
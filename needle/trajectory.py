@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_columns(data):
+    "Return data as a 2D float array, one trajectory per column."
+    values = np.asarray(data, dtype=float)
+    if values.ndim == 1:
+        return values[:, np.newaxis]
+    if values.ndim != 2:
+        raise ValueError("data must be one- or two-dimensional")
+    return values
+
+
+def _fft_size(n):
+    "A power of two long enough for correlations without wrap-around"
+    return 1 << int(np.ceil(np.log2(max(2*n - 1, 1))))
+
+
+def _lag_sums(spectrum, size, max_lag):
+    """Transform back a sum of products of spectra, A.conj()*B, giving for
+    each lag k and column the sum over i of a[i]*b[i + k]."""
+    return np.fft.irfft(spectrum, size, axis=0)[:max_lag + 1]
+
+
+def _format(result, data, ensemble):
+    "Label lags and trajectories like the input."
+    lags = pd.Index(np.arange(len(result)), name='lag')
+    if ensemble:
+        return pd.Series(result, index=lags)
+    if isinstance(data, pd.DataFrame):
+        return pd.DataFrame(result, index=lags, columns=data.columns)
+    if np.ndim(data) == 1:
+        return pd.Series(result[:, 0], index=lags)
+    return pd.DataFrame(result, index=lags)
+
+
+def _lagged_mean(numerator, counts, ensemble):
+    "Divide sums over pairs of points by the number of pairs."
+    if ensemble:
+        numerator, counts = numerator.sum(axis=1), counts.sum(axis=1)
+    return np.where(counts > 0.5, numerator/np.maximum(counts, 1), np.nan)
+
+
+def unwrap(angles, period=np.pi):
+    """Remove the jumps of a whole period from angles, skipping NaNs.
+
+    Orientations of an axis are defined modulo pi, so an angle crossing
+    the end of the range jumps back by pi. Unwrap them before computing
+    displacements.
+
+    Parameters
+    ----------
+    angles : Series, DataFrame or array, in radians, with trajectories in
+        columns
+    period : default pi
+
+    Returns
+    -------
+    unwrapped angles, like the input
+    """
+    values = _as_columns(angles).copy()
+    for column in values.T:
+        finite = np.isfinite(column)
+        scaled = column[finite]*(2*np.pi/period)
+        column[finite] = np.unwrap(scaled)*(period/(2*np.pi))
+    if isinstance(angles, (pd.Series, pd.DataFrame)):
+        result = angles.copy()
+        result[:] = values.reshape(np.shape(angles))
+        return result
+    return values.reshape(np.shape(angles))
+
+
+def msad(angles, max_lag=None, ensemble=False):
+    """Compute the mean squared angular displacement at every lag.
+
+    For each lag k, average (angle[i + k] - angle[i])**2 over all the pairs
+    of points in which neither is NaN. Instead of a loop over lags, the sums
+    come from FFT correlations, in O(n log n) time for all lags.
+
+    Parameters
+    ----------
+    angles : Series, DataFrame or array, in radians, indexed by frame, with
+        trajectories in columns. The angles must be continuous: see unwrap.
+    max_lag : largest lag, in frames. Default: the length of the data - 1.
+    ensemble : boolean
+        If True, average over all the trajectories together, weighting
+        each by its number of pairs. False by default.
+
+    Returns
+    -------
+    Series (for one trajectory or ensemble=True) or DataFrame, indexed by
+    lag; NaN where there are no pairs
+    """
+    values = _as_columns(angles)
+    n = len(values)
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    mask = np.isfinite(values)
+    # Subtracting each trajectory's mean leaves displacements unchanged and
+    # keeps the squares, and the rounding error of their difference, small.
+    counts = mask.sum(axis=0)
+    mean = np.where(mask, values, 0).sum(axis=0)/np.maximum(counts, 1)
+    values = np.where(mask, values - mean, 0.)
+    # sum of (x[i + k] - x[i])**2 = sum x[i + k]**2 + x[i]**2 - 2 x[i] x[i + k]
+    # for pairs of valid points, from the spectra of the mask, x and x**2
+    size = _fft_size(n)
+    W = np.fft.rfft(mask, size, axis=0)
+    X = np.fft.rfft(values, size, axis=0)
+    S = np.fft.rfft(values**2, size, axis=0)
+    numerator = _lag_sums(2*(W.conj()*S).real - 2*np.abs(X)**2,
+                          size, max_lag)
+    pairs = _lag_sums(np.abs(W)**2, size, max_lag)
+    result = _lagged_mean(np.maximum(numerator, 0), pairs, ensemble)
+    return _format(result, angles, ensemble)
+
+
+def orientation_autocorrelation(angles, max_lag=None, axial=False,
+                                ensemble=False):
+    """Compute the autocorrelation of orientation at every lag.
+
+    For each lag k, average cos(angle[i + k] - angle[i]) = cos*cos + sin*sin
+    over all the pairs of points in which neither is NaN, using FFT
+    correlations of the cosines and sines, in O(n log n) time for all lags.
+
+    Parameters
+    ----------
+    angles : Series, DataFrame or array, in radians, indexed by frame, with
+        trajectories in columns. They need not be unwrapped.
+    max_lag : largest lag, in frames. Default: the length of the data - 1.
+    axial : boolean
+        If True, treat angles as orientations of an axis, defined modulo
+        pi, and correlate the doubled angles: cos(2*(angle[i + k] -
+        angle[i])). False by default.
+    ensemble : boolean
+        If True, average over all the trajectories together, weighting
+        each by its number of pairs. False by default.
+
+    Returns
+    -------
+    Series (for one trajectory or ensemble=True) or DataFrame, indexed by
+    lag; 1 at lag 0, and NaN where there are no pairs
+    """
+    values = _as_columns(angles)
+    n = len(values)
+    max_lag = n - 1 if max_lag is None else min(max_lag, n - 1)
+    if axial:
+        values = 2*values
+    mask = np.isfinite(values)
+    size = _fft_size(n)
+    # cos*cos + sin*sin is the real part of exp(i angle[i]).conj() *
+    # exp(i angle[i + k]), whose lag sums come from one complex FFT.
+    phasor = np.where(mask, np.exp(1j*values), 0)
+    Z = np.fft.fft(phasor, size, axis=0)
+    numerator = np.fft.ifft(np.abs(Z)**2, axis=0)[:max_lag + 1].real
+    W = np.fft.rfft(mask, size, axis=0)
+    pairs = _lag_sums(np.abs(W)**2, size, max_lag)
+    result = _lagged_mean(numerator, pairs, ensemble)
+    return _format(result, angles, ensemble)